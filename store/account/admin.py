@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from unfold.admin import ModelAdmin
 from . import models
 
@@ -27,6 +29,20 @@ class UserAdmin(ModelAdmin):
 
     show_facets = admin.ShowFacets.ALWAYS
 
+    def get_search_results(self, request, queryset, search_term):
+        # A full email address -> exact case-insensitive match on user_email_upper_idx;
+        # fragments like "@example.com" fall through to the substring search
+        term = search_term.strip()
+        try:
+            validate_email(term)
+        except ValidationError:
+            pass
+        else:
+            return queryset.filter(email__iexact=term), False
+
+        # Default icontains search; user_search_trgm_idx serves its UPPER(col) LIKE '%q%'
+        return super().get_search_results(request, queryset, search_term)
+
     def get_readonly_fields(self, request, obj=None):
         # Start with default readonly fields
         readonly = list(super().get_readonly_fields(request, obj) or [])
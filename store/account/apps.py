@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        # Register all Pillow image plugins once per process (web & Celery workers)
+        # instead of lazily on the first avatar upload
+        from PIL import Image
+        Image.init()
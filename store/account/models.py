@@ -1,7 +1,9 @@
 import os
 import uuid
 import logging
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from PIL import Image
@@ -9,6 +11,7 @@ from io import BytesIO
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
+from . import tasks
 
 # Set up logging for debugging
 logger = logging.getLogger(__name__)
@@ -25,38 +28,51 @@ def _get_avatar_upload_path(instance, filename):
     Returns:
         str: Path in format 'avatars/YYYY/MM/unique_filename.jpg'
     """
-    now = timezone.now()
-    basepath = 'avatars'
-
-    # Generate a unique filename using UUID4
-    unique_filename = str(uuid.uuid4())
+    subdir = timezone.now().strftime("%Y/%m")
 
+    # Unique filename from UUID4 hex (no dashes, cheaper than str(uuid))
     # Always use .jpg extension since we convert all images to JPEG
-    new_filename = f"{unique_filename}.jpg"
+    new_filename = f"{uuid.uuid4().hex}.jpg"
 
     # Create path: avatars/2025/09/unique_id.jpg
-    return os.path.join(basepath, now.strftime("%Y/%m"), new_filename)
+    # Storage keys always use forward slashes, so no os.path.join needed
+    return f"avatars/{subdir}/{new_filename}"
 
 
 class User(AbstractUser):
     email = models.EmailField("email address", blank=False, unique=True)
-    phone = models.CharField("Phone Number", max_length=15)
+    phone = models.CharField("Phone Number", max_length=15, db_index=True)
     address = models.TextField("Address", blank=True, null=True)
     avatar = models.ImageField(upload_to=_get_avatar_upload_path, blank=True, null=True)
 
-    # Track original avatar for change detection and cleanup
-    _original_avatar = None
-    _original_avatar_name = None
-
-    def __init__(self, *args, **kwargs):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Trigram index over UPPER(col), the expression Postgres runs for the
+            # admin's icontains search, so the '%q%' LIKEs become index scans
+            GinIndex(
+                *[
+                    OpClass(Upper(field), name='gin_trgm_ops')
+                    for field in ('username', 'email', 'first_name', 'last_name', 'phone')
+                ],
+                name='user_search_trgm_idx',
+            ),
+            # Serves email__iexact, which Postgres runs as UPPER(email) = UPPER(%s)
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+        ]
+
+    # Avatar name as loaded from the DB, for change detection and cleanup
+    _loaded_avatar_name = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
         """
-        Initialize the model and store original avatar value.
-        This helps us detect when avatar field changes.
+        Remember the stored avatar name for rows loaded from the DB.
+        Done here (not in __init__) so plain list queries pay nothing for it.
         """
-        super().__init__(*args, **kwargs)
-        # Store original avatar value to detect changes
-        self._original_avatar = self.avatar
-        self._original_avatar_name = self.avatar.name if self.avatar else None
+        instance = super().from_db(db, field_names, values)
+        if 'avatar' in field_names:
+            instance._loaded_avatar_name = values[field_names.index('avatar')] or None
+        return instance
 
     def save(self, *args, **kwargs):
         """
@@ -67,64 +83,50 @@ class User(AbstractUser):
 
         # Track if we need to delete old avatar
         old_avatar_to_delete = None
+        avatar_needs_processing = False
 
-        # Only process avatar if it exists and we're not skipping processing
-        if self.avatar and not skip_avatar_processing:
-            # Check if avatar has actually changed
-            if self._avatar_has_changed():
-                try:
-                    # Store old avatar name before processing (for deletion)
-                    if self.pk and self._original_avatar_name:
-                        old_avatar_to_delete = self._original_avatar_name
-
-                    self._process_avatar()
-                    logger.info(f"Avatar processed for user {self.username}")
-
-                except Exception as e:
-                    logger.error(f"Error processing avatar for user {self.username}: {e}")
-
+        # Only process avatar if it has changed and we're not skipping processing
+        if not skip_avatar_processing and self._avatar_has_changed():
+            # Store old avatar name (for deletion)
+            if self.pk and self._loaded_avatar_name:
+                old_avatar_to_delete = self._loaded_avatar_name
+            avatar_needs_processing = True
 
+        # Save the raw upload first; it is processed in the background
         super().save(*args, **kwargs)
 
         # Delete old avatar file AFTER successful save
         if old_avatar_to_delete:
             self._delete_avatar_file(old_avatar_to_delete)
 
-        # Update the original avatar tracker after successful save
-        self._original_avatar = self.avatar
-        self._original_avatar_name = self.avatar.name if self.avatar else None
+        # Only enqueue once the row (and the raw file name) is committed
+        if avatar_needs_processing:
+            user_id = self.pk
+            transaction.on_commit(lambda: tasks.process_avatar.delay(user_id))
+
+        # Update the loaded avatar tracker after successful save
+        if 'avatar' not in self.get_deferred_fields():
+            self._loaded_avatar_name = self.avatar.name or None
 
     def _avatar_has_changed(self):
         """
-        Check if the avatar field has been changed.
+        Check if a new avatar has been set since the row was loaded.
 
         Returns:
             bool: True if avatar has changed, False otherwise
         """
-        # For new instances, always consider it changed if avatar exists
-        if not self.pk:
-            return bool(self.avatar)
-
-        # Handle None cases
-        if not self._original_avatar and not self.avatar:
-            return False  # Both None, no change
-
-        if bool(self._original_avatar) != bool(self.avatar):
-            return True  # One is None, other isn't
-
-        # Compare file names for reliable detection
-        current_name = self.avatar.name if self.avatar else None
+        # Deferred (never loaded or assigned) -> untouched; don't trigger a query
+        if 'avatar' in self.get_deferred_fields():
+            return False
 
-        # If it's the same name, no change
-        if self._original_avatar_name == current_name:
+        if not self.avatar:
             return False
 
-        # If current avatar is an uploaded file (doesn't have a storage name yet), it's new
-        if hasattr(self.avatar, 'temporary_file_path') or not current_name:
+        # For new instances, always consider it changed if avatar exists
+        if not self.pk:
             return True
 
-        # Different names = change
-        return self._original_avatar_name != current_name
+        return self.avatar.name != self._loaded_avatar_name
 
     def _process_avatar(self):
         """
@@ -132,7 +134,6 @@ class User(AbstractUser):
         - Crop to center square
         - Resize to 512x512
         - Convert to JPEG format
-        - Optimize quality
         """
         try:
             img = Image.open(self.avatar)
@@ -140,7 +141,12 @@ class User(AbstractUser):
             # Define target size
             target_size = (512, 512)
 
-            # Get current dimensions
+            # For JPEG uploads, let libjpeg-turbo decode at 1/2, 1/4 or 1/8 scale
+            # (no-op for PNG/WebP). Ask for ~2x the target so LANCZOS still has
+            # enough source pixels for a sharp result.
+            img.draft('RGB', (target_size[0] * 2, target_size[1] * 2))
+
+            # Get current dimensions (after any draft scaling)
             width, height = img.size
 
             # Calculate center crop coordinates for square aspect ratio
@@ -150,11 +156,11 @@ class User(AbstractUser):
             right = left + min_dimension
             bottom = top + min_dimension
 
-            # Crop to center square
-            img = img.crop((left, top, right, bottom))
-
-            # Resize to target size using high-quality resampling
-            img = img.resize(target_size, Image.Resampling.LANCZOS)
+            # Crop to center square and resize in one pass (no intermediate crop copy).
+            # reducing_gap lets Pillow box-reduce by an integer factor first, so
+            # LANCZOS only runs over a buffer ~3x the target size.
+            img = img.resize(target_size, Image.Resampling.LANCZOS,
+                             box=(left, top, right, bottom), reducing_gap=3.0)
 
             # Convert to RGB mode (removes alpha channel, ensures JPEG compatibility)
             if img.mode != 'RGB':
@@ -163,8 +169,11 @@ class User(AbstractUser):
             # Prepare output buffer
             output_buffer = BytesIO()
 
-            # Save as JPEG with good quality
-            img.save(output_buffer, format='JPEG', quality=90, optimize=True)
+            # Save as JPEG with good quality. Pillow encodes through libjpeg-turbo's
+            # SIMD path; optimize=True would add a second Huffman pass per save.
+            img.save(output_buffer, format='JPEG', quality=90, subsampling='4:2:0')
+            # Encoded size is the write position; avoids copying the bytes via getvalue()
+            size = output_buffer.tell()
             output_buffer.seek(0)
 
             # Generate new filename using our upload path function
@@ -176,7 +185,7 @@ class User(AbstractUser):
                 field_name='avatar',
                 name=os.path.basename(new_filename),  # Just filename
                 content_type='image/jpeg',
-                size=len(output_buffer.getvalue()),
+                size=size,
                 charset=None
             )
 
@@ -202,12 +211,12 @@ class User(AbstractUser):
             # Django's default storage to delete the file
             from django.core.files.storage import default_storage
 
-            if default_storage.exists(file_path):
-                default_storage.delete(file_path)
-                logger.info(f"Deleted old avatar file: {file_path}")
-            else:
-                logger.warning(f"Avatar file not found for deletion: {file_path}")
+            # Delete directly: an exists() probe is an extra round trip on remote storages
+            default_storage.delete(file_path)
+            logger.info(f"Deleted old avatar file: {file_path}")
 
+        except FileNotFoundError:
+            logger.warning(f"Avatar file not found for deletion: {file_path}")
         except Exception as e:
             logger.error(f"Error deleting avatar file {file_path}: {e}")
 
@@ -219,14 +228,14 @@ class User(AbstractUser):
             old_name = self.avatar.name
             self.avatar.delete(save=False)
             self.avatar = None
-            self.save()
+            self.save(update_fields=['avatar'], skip_avatar_processing=True)
             logger.info(f"User {self.username} deleted their avatar: {old_name}")
 
     def __str__(self):
         return f"{self.username}"
 
 
-@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=User, dispatch_uid='account.user.avatar_cleanup')
 def cleanup_avatar_on_user_delete(sender, instance, **kwargs):
     """
     Delete avatar file when user is deleted.
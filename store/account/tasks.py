@@ -0,0 +1,60 @@
+import logging
+import smtplib
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def process_avatar(user_id):
+    """
+    Crop/resize/re-encode a freshly uploaded avatar outside the request cycle.
+    The raw upload is served until this finishes, then it is replaced and deleted.
+    """
+    User = get_user_model()
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return
+
+    if not user.avatar:
+        return
+
+    raw_name = user.avatar.name
+    user._process_avatar()
+
+    # _process_avatar logs & keeps the original avatar if processing failed
+    if user.avatar.name == raw_name:
+        return
+
+    user.save(update_fields=['avatar'], skip_avatar_processing=True)
+    user._delete_avatar_file(raw_name)
+    logger.info(f"Avatar processed for user {user.username}")
+
+
+@shared_task(autoretry_for=(smtplib.SMTPException, OSError), retry_backoff=True, max_retries=3)
+def send_activation_email(user_id, activation_link):
+    """
+    Send the signup activation email, so the SMTP round trip is off the signup request.
+    """
+    User = get_user_model()
+    try:
+        user = User.objects.only('first_name', 'email').get(pk=user_id)
+    except User.DoesNotExist:
+        return
+
+    email_body = render_to_string('account/signup_email.html',
+                                  {'user': user,
+                                   'activation_link': activation_link,
+                                   })
+
+    email = EmailMessage(
+        subject="Please activate your account",
+        body=email_body,
+        to=[user.email])
+
+    email.content_subtype = "html"  # Enable HTML
+    email.send()
@@ -1,11 +1,11 @@
 from django.shortcuts import render, redirect
 from django.views import View
 from . import forms
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
+from . import tasks
+from django.db import transaction
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.contrib.sites.shortcuts import get_current_site
+from django.urls import reverse
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth import get_user_model
 
@@ -25,28 +25,16 @@ class SignupView(View):
             # obj = form.save()  # creates obj & saves it to db
             user = form.save(commit=False)  # creates obj but don't save it to db
             user.is_active = False  # Require email confirmation to login
-            user.save()  # save to db
+            user.save(skip_avatar_processing=True)  # save to db (avatar isn't part of the signup form)
 
-            # Generate activation link
-            current_site = get_current_site(request)
+            # Generate activation link (from the request host, no django_site lookup)
             uid = urlsafe_base64_encode(force_bytes(user.pk))
             token = default_token_generator.make_token(user)
-            activation_link = f"https://{current_site.domain}/account/activate/{uid}/{token}/"
+            activation_link = request.build_absolute_uri(reverse('account:activate', args=[uid, token]))
 
-            email_subject = "Please activate your account"
-            email_to = [user.email]  # list of user emails
-            email_body = render_to_string('account/signup_email.html',
-                                    {'user':user,
-                                            'activation_link': activation_link,
-                                            })
-
-            email = EmailMessage(
-                subject = email_subject,
-                body = email_body,
-                to=email_to)
-
-            email.content_subtype = "html"  # Enable HTML
-            email.send()
+            # Send the email from a Celery worker once the new user is committed
+            user_id = user.pk
+            transaction.on_commit(lambda: tasks.send_activation_email.delay(user_id, activation_link))
 
             # to tell user activation link is sent
             return render(request, 'account/signup_done.html', {'user': user})
@@ -60,7 +48,8 @@ class ActivateAccountView(View):
         try:
             # Decode the user ID
             uid = force_str(urlsafe_base64_decode(uidb64))
-            user = User.objects.get(pk=uid)
+            # Load only what the token check needs (it hashes pk, password, last_login & email)
+            user = User.objects.only('pk', 'is_active', 'password', 'last_login', 'email').get(pk=uid)
         except (TypeError, ValueError, OverflowError, User.DoesNotExist):
             user = None
 
@@ -68,7 +57,7 @@ class ActivateAccountView(View):
         if user is not None and default_token_generator.check_token(user, token):
             # Activate the user
             user.is_active = True
-            user.save()
+            user.save(update_fields=['is_active'], skip_avatar_processing=True)
             return render(request, 'account/activation_success.html')
         else:
             return render(request, 'account/activation_invalid.html')
\ No newline at end of file
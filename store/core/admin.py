@@ -2,6 +2,7 @@ from django.contrib import admin
 from unfold.admin import ModelAdmin
 from . import models
 from django.utils import timezone
+from django.db.models import Count
 
 
 class ProductAdmin(ModelAdmin):
@@ -18,6 +19,9 @@ class ProductAdmin(ModelAdmin):
         'deleted',
     )
 
+    # category & user are rendered per row, fetch them with one JOIN
+    list_select_related = ('category', 'user')
+
     list_filter = (
         'enabled',
         'deleted',
@@ -49,7 +53,7 @@ class ProductAdmin(ModelAdmin):
             'fields': ('description', 'image')
         }),
         ('System Info', {
-            'fields': ('uuid', 'create_date', 'modified_date', 'deleted', 'deleted_date'),
+            'fields': ('uuid', 'create_date', 'modified_date', 'deleted', 'deleted_date', 'image_processed'),
             'classes': ('collapse',),  # Collapsible section
         }),
     )
@@ -60,6 +64,7 @@ class ProductAdmin(ModelAdmin):
         'create_date',
         'modified_date',
         'deleted_date',
+        'image_processed',
     )
 
     # Automatically prepopulate slug from name
@@ -131,10 +136,15 @@ class CategoryAdmin(ModelAdmin):
             obj.deleted_date = None
         super().save_model(request, obj, form, change)
 
+    def get_queryset(self, request):
+        # Count products in the same query instead of one COUNT per row
+        return super().get_queryset(request).annotate(_product_count=Count('products'))
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj._product_count
 
     product_count.short_description = "Products"
+    product_count.admin_order_field = '_product_count'
 
 
 
@@ -144,6 +154,7 @@ class CommentAdmin(ModelAdmin):
 
 class PaymentAdmin(ModelAdmin):
     list_display = ['user', 'status', 'total', 'ref']
+    list_select_related = ['invoice__user']
     list_filter = ['status']
     search_fields = ['invoice__user__username', 'ref']
     fieldsets = (
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-15 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_category_slug_alter_product_discount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_processed',
+            field=models.BooleanField(default=True, editable=False, help_text='False while a new image is being processed in the background'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-15 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_product_image_processed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['enabled', 'deleted', 'count'], name='product_listing_idx'),
+        ),
+    ]
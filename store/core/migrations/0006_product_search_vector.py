@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-15 18:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+from django.contrib.postgres.search import SearchVector
+
+
+def populate_search_vector(apps, schema_editor):
+    """Fill search_vector for existing products, one UPDATE per category."""
+    Category = apps.get_model('core', 'Category')
+    Product = apps.get_model('core', 'Product')
+    for category_id, category_name in Category.objects.values_list('id', 'name'):
+        Product.objects.filter(category_id=category_id).update(
+            search_vector=(
+                SearchVector('name', weight='A', config='english')
+                + SearchVector('description', weight='B', config='english')
+                + SearchVector(models.Value(category_name, output_field=models.TextField()),
+                               weight='C', config='english')
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_product_listing_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_product_search_vector'),
+    ]
+
+    operations = [
+        # Invoice numbers come from this sequence (see Invoice.next_number);
+        # it starts after the highest number already issued
+        migrations.RunSQL(
+            sql=[
+                "CREATE SEQUENCE invoice_number_seq;",
+                "SELECT setval('invoice_number_seq', COALESCE(MAX(number), 0) + 1, false) FROM core_invoice;",
+            ],
+            reverse_sql="DROP SEQUENCE invoice_number_seq;",
+        ),
+    ]
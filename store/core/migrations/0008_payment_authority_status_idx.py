@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_invoice_number_seq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['authority', 'status'], name='payment_authority_status_idx'),
+        ),
+    ]
@@ -1,19 +1,28 @@
 import os
 import uuid
 import logging
-from django.db import models
+from functools import lru_cache
+from django.db import models, transaction, connection
+from django.db.models import F, Case, When, Value
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_save, post_delete
+from django.core.cache import cache
 from django.dispatch import receiver
 from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from tempfile import SpooledTemporaryFile
+from django.core.files import File
 from django.utils.text import slugify
+from . import tasks
 
 # Set up logging for debugging
 logger = logging.getLogger(__name__)
 
+# slugify runs unicode normalization + regexes; names repeat a lot in bulk imports
+_slugify_cached = lru_cache(maxsize=2048)(slugify)
+
 User = get_user_model()
 
 
@@ -74,22 +83,46 @@ class Product(Base):
     description = models.TextField()
     category = models.ForeignKey('Category', on_delete=models.PROTECT, related_name='products')
     image = models.ImageField(upload_to=_get_product_image_upload_path, null=True, blank=True)
+    image_processed = models.BooleanField(default=True, editable=False,
+                                          help_text="False while a new image is being processed in the background")
     count = models.IntegerField(default=0)
     # status = models.IntegerField(default=STATUS_ENABLED, choices=STATUS_CHOICES)
+    # Full-text search document, kept up to date by save() (see update_search_vector)
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    # Image processing tracking
-    _original_image = None
+    class Meta:
+        indexes = [
+            # Storefront filter used by the product list & sitemap
+            models.Index(fields=['enabled', 'deleted', 'count'], name='product_listing_idx'),
+            # Backing indexes for SearchView
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    # Fields that feed search_vector (and their column attnames)
+    SEARCH_FIELDS = {'name', 'description', 'category'}
+    SEARCH_ATTNAMES = ('name', 'description', 'category_id')
+
+    # Image name as loaded from the DB, for change detection and cleanup
     _original_image_name = None
 
-    def __init__(self, *args, **kwargs):
+    # search_vector inputs as loaded from the DB, so unchanged saves skip the rebuild
+    _original_search_inputs = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
         """
-        Initialize the model and store original image value.
-        This helps us detect when image field changes.
+        Remember the stored image name and search inputs for rows loaded from the DB.
+        Done here (not in __init__) so listing/sitemap rows pay nothing for it.
         """
-        super().__init__(*args, **kwargs)
-        # Store original image value to detect changes
-        self._original_image = self.image
-        self._original_image_name = self.image.name if self.image else None
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._original_image_name = values[field_names.index('image')] or None
+        instance._original_search_inputs = {
+            attname: values[field_names.index(attname)]
+            for attname in cls.SEARCH_ATTNAMES if attname in field_names
+        }
+        return instance
 
     def save(self, *args, **kwargs):
         """
@@ -97,68 +130,127 @@ class Product(Base):
         """
         # Auto-generate slug from name if not provided
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = _slugify_cached(self.name)
 
         # Check if this is image processing to prevent recursion
         skip_image_processing = kwargs.pop('skip_image_processing', False)
 
+        # Rebuild the search document only when one of its inputs actually changed
+        update_fields = kwargs.get('update_fields')
+        search_needs_update = (
+            (update_fields is None
+             or bool(self.SEARCH_FIELDS.union(self.SEARCH_ATTNAMES).intersection(update_fields)))
+            and self._search_inputs_changed()
+        )
+
+        # search_vector is only written by update_search_vector(); keep the (possibly
+        # stale) in-memory value out of plain saves of an existing row
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in deferred and f.name != 'search_vector'
+            ]
+
         # Track if we need to delete old image
         old_image_to_delete = None
+        image_needs_processing = False
 
-        # Only process image if it exists and we're not skipping processing
-        if self.image and not skip_image_processing:
-            # Check if image has actually changed
-            if self._image_has_changed():
-                try:
-                    # Store old image name before processing (for deletion)
-                    if self.pk and self._original_image_name:
-                        old_image_to_delete = self._original_image_name
+        # Only process image if it has changed and we're not skipping processing
+        if not skip_image_processing and self._image_has_changed():
+            # Store old image name (for deletion)
+            if self.pk and self._original_image_name:
+                old_image_to_delete = self._original_image_name
 
-                    self._process_image()
-                    logger.info(f"Image processed for product {self.name}")
+            # Templates show a placeholder until the task has processed it
+            self.image_processed = False
+            image_needs_processing = True
 
-                except Exception as e:
-                    logger.error(f"Error processing image for product {self.name}: {e}")
-
-        # Call parent save method
+        # Call parent save method (stores the raw upload)
         super().save(*args, **kwargs)
 
-        # Delete old image file AFTER successful save
+        # Delete old image file AFTER successful commit (kept if the transaction rolls back)
         if old_image_to_delete:
-            self._delete_image_file(old_image_to_delete)
+            transaction.on_commit(lambda: self._delete_image_file(old_image_to_delete))
+
+        # Only enqueue once the row (and the raw file name) is committed
+        if image_needs_processing:
+            product_id = self.pk
+            transaction.on_commit(lambda: tasks.process_product_image.delay(product_id))
+
+        if search_needs_update:
+            self.update_search_vector()
+            # Snapshot the inputs that were just written
+            deferred = self.get_deferred_fields()
+            saved = dict(self._original_search_inputs or {})
+            for attname in self.SEARCH_ATTNAMES:
+                if attname in deferred:
+                    continue
+                if update_fields is None or {attname, attname.removesuffix('_id')} & set(update_fields):
+                    saved[attname] = getattr(self, attname)
+            self._original_search_inputs = saved
 
         # Update the original image tracker after successful save
-        self._original_image = self.image
-        self._original_image_name = self.image.name if self.image else None
+        if 'image' not in self.get_deferred_fields():
+            self._original_image_name = self.image.name or None
 
-    def _image_has_changed(self):
+    @staticmethod
+    def search_vector_expression(category_name):
+        """
+        Weighted tsvector over name (A), description (B) and category name (C).
+        The category name is passed in because UPDATE can't reference joined columns.
+        """
+        return (
+            SearchVector('name', weight='A', config='english')
+            + SearchVector('description', weight='B', config='english')
+            + SearchVector(Value(category_name, output_field=models.TextField()),
+                           weight='C', config='english')
+        )
+
+    def update_search_vector(self):
         """
-        Check if the image field has been changed.
+        Recompute search_vector in the database for this product.
         """
-        # For new instances, always consider it changed if image exists
-        if not self.pk:
-            return bool(self.image)
+        Product.objects.filter(pk=self.pk).update(
+            search_vector=self.search_vector_expression(self.category.name)
+        )
 
-        # Handle None cases
-        if not self._original_image and not self.image:
-            return False  # Both None, no change
+    def _search_inputs_changed(self):
+        """
+        Check if name, description or category differ from the loaded row.
+        """
+        # New instance, or not loaded through from_db
+        if self._original_search_inputs is None:
+            return True
 
-        if bool(self._original_image) != bool(self.image):
-            return True  # One is None, other isn't
+        deferred = self.get_deferred_fields()
+        for attname in self.SEARCH_ATTNAMES:
+            # Deferred (never loaded or assigned) -> untouched; don't trigger a query
+            if attname in deferred:
+                continue
+            if attname not in self._original_search_inputs:
+                return True
+            if getattr(self, attname) != self._original_search_inputs[attname]:
+                return True
+        return False
 
-        # Compare file names for reliable detection
-        current_name = self.image.name if self.image else None
+    def _image_has_changed(self):
+        """
+        Check if a new image has been set since the row was loaded.
+        """
+        # Deferred (never loaded or assigned) -> untouched; don't trigger a query
+        if 'image' in self.get_deferred_fields():
+            return False
 
-        # If it's the same name, no change
-        if self._original_image_name == current_name:
+        current_name = self.image.name or None
+        if current_name is None:
             return False
 
-        # If current image is an uploaded file (doesn't have a storage name yet), it's new
-        if hasattr(self.image, 'temporary_file_path') or not current_name:
+        # New instance, or a fresh upload not yet written to storage
+        if not self.pk or not self.image._committed:
             return True
 
-        # Different names = change
-        return self._original_image_name != current_name
+        return current_name != self._original_image_name
 
     def _process_image(self):
         """
@@ -167,6 +259,9 @@ class Product(Base):
         - Convert to JPEG format
         - Optimize for web use
         - Maintain aspect ratio with smart cropping if needed
+
+        Returns:
+            bool: False if the upload was already a web-sized JPEG and was kept as is
         """
         try:
             img = Image.open(self.image)
@@ -175,7 +270,17 @@ class Product(Base):
             max_width = 800
             max_height = 800
 
-            # Get current dimensions
+            # Already a web-sized RGB JPEG: Image.open only parsed the header,
+            # so skip the decode, resize and re-encode entirely
+            if img.format == 'JPEG' and img.mode == 'RGB' and img.width <= max_width and img.height <= max_height:
+                img.close()
+                return False
+
+            # For JPEG uploads, let libjpeg-turbo decode at 1/2, 1/4 or 1/8 scale
+            # while both sides stay >= target (no-op for PNG/WebP)
+            img.draft('RGB', (max_width, max_height))
+
+            # Get current dimensions (after any draft scaling)
             width, height = img.size
 
             # Calculate scaling to fit within max dimensions while maintaining aspect ratio
@@ -183,43 +288,48 @@ class Product(Base):
             scale_height = max_height / height
             scale = min(scale_width, scale_height)
 
+            # Convert to RGB mode first (removes alpha channel, ensures JPEG compatibility).
+            # Resizing 3 channels is cheaper than 4, and P/1 modes would otherwise
+            # be resized with NEAREST instead of LANCZOS.
+            if img.mode != 'RGB':
+                original_mode = img.mode
+                img = img.convert('RGB')
+                logger.info(f"Converted image mode from {original_mode} to RGB")
+
             # Only resize if image is larger than target
             if scale < 1:
                 new_width = int(width * scale)
                 new_height = int(height * scale)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                # reducing_gap box-reduces by an integer factor before LANCZOS
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
                 logger.info(f"Resized image from {width}x{height} to {new_width}x{new_height}")
 
-            # Convert to RGB mode (removes alpha channel, ensures JPEG compatibility)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-                logger.info(f"Converted image mode from {img.mode} to RGB")
-
             # Prepare output buffer
-            output_buffer = BytesIO()
-
-            # Save as JPEG with good quality for product images
-            img.save(output_buffer, format='JPEG', quality=85, optimize=True)
+            # Kept in memory up to 1 MB, spilled to a temp file beyond that
+            output_buffer = SpooledTemporaryFile(max_size=1 << 20, suffix='.jpg')
+
+            # Save as JPEG with good quality for product images. Pillow encodes through
+            # libjpeg-turbo's SIMD path; optimize=True would add a second Huffman pass.
+            img.save(output_buffer, format='JPEG', quality=85, subsampling='4:2:0')
+            # Encoded size is the write position; avoids copying the bytes via getvalue()
+            size = output_buffer.tell()
             output_buffer.seek(0)
 
             # Generate new filename using our upload path function
             new_filename = _get_product_image_upload_path(self, 'product.jpg')
 
-            # Create new InMemoryUploadedFile
-            self.image = InMemoryUploadedFile(
-                file=output_buffer,
-                field_name='image',
-                name=os.path.basename(new_filename),  # Just filename
-                content_type='image/jpeg',
-                size=len(output_buffer.getvalue()),
-                charset=None
-            )
+            # Plain File so storage streams it in 64 KB chunks; InMemoryUploadedFile.chunks()
+            # would read a spilled buffer back into memory in one piece
+            processed_file = File(output_buffer, name=os.path.basename(new_filename))
+            processed_file.size = size
+            self.image = processed_file
 
             # Set the full path for Django's storage system
             self.image.name = new_filename
 
             # Clean up PIL image
             img.close()
+            return True
 
         except Exception as e:
             # Log the specific error for debugging
@@ -234,12 +344,12 @@ class Product(Base):
             # Use Django's default storage to delete the file
             from django.core.files.storage import default_storage
 
-            if default_storage.exists(file_path):
-                default_storage.delete(file_path)
-                logger.info(f"Deleted old product image file: {file_path}")
-            else:
-                logger.warning(f"Product image file not found for deletion: {file_path}")
+            # Delete directly: an exists() probe is an extra round trip on remote storages
+            default_storage.delete(file_path)
+            logger.info(f"Deleted old product image file: {file_path}")
 
+        except FileNotFoundError:
+            logger.warning(f"Product image file not found for deletion: {file_path}")
         except Exception as e:
             logger.error(f"Error deleting product image file {file_path}: {e}")
 
@@ -249,17 +359,16 @@ class Product(Base):
         return f"{self.name}"
 
 
-@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Product, dispatch_uid='core.product.image_cleanup')
 def cleanup_image_on_product_delete(sender, instance, **kwargs):
     """
     Delete product image file when product is deleted.
+    The storage call runs on a worker after commit, so bulk deletes don't
+    block the request with one storage round trip per product.
     """
     if instance.image:
-        try:
-            instance.image.delete(save=False)
-            logger.info(f"Cleaned up image for deleted product: {instance.name}")
-        except Exception as e:
-            logger.error(f"Error cleaning up image for deleted product {instance.name}: {e}")
+        image_name = instance.image.name
+        transaction.on_commit(lambda: tasks.delete_product_image.delay(image_name))
 
 
 class Category(Base):
@@ -268,16 +377,60 @@ class Category(Base):
     parent = models.ForeignKey('Category', null=True, blank=True, default=None,
                                on_delete= models.PROTECT, related_name='children')
 
+    # Name as loaded from the DB (see refresh_category_search_vectors)
+    _original_name = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'name' in field_names:
+            instance._original_name = values[field_names.index('name')]
+        return instance
+
     def save(self, *args, **kwargs):
         """Auto-generate slug from name if not provided."""
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = _slugify_cached(self.name)
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'name' in update_fields) and 'name' not in self.get_deferred_fields():
+            self._original_name = self.name
 
     def __str__(self):
         return f"{self.name}"
 
 
+# Cache key for the category dropdown on the product list (see views.get_listing_categories)
+CATEGORY_LIST_CACHE_KEY = 'core:category_list'
+
+
+@receiver(post_save, sender=Category, dispatch_uid='core.category.list_cache')
+@receiver(post_delete, sender=Category, dispatch_uid='core.category.list_cache_delete')
+def invalidate_category_list_cache(sender, **kwargs):
+    """
+    Drop the cached category list whenever a category changes.
+    """
+    cache.delete(CATEGORY_LIST_CACHE_KEY)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='core.category.search_vectors')
+def refresh_category_search_vectors(sender, instance, created, update_fields=None, **kwargs):
+    """
+    The category name is part of each product's search_vector; rebuild them
+    with one UPDATE when a category is renamed. Other edits (deleted, parent, ...)
+    leave the vectors alone.
+    """
+    if created or 'name' in instance.get_deferred_fields():
+        return
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    if instance.name == instance._original_name:
+        return
+    Product.objects.filter(category=instance).update(
+        search_vector=Product.search_vector_expression(instance.name)
+    )
+
+
 class Comment(Base):
     name = models.CharField(max_length=255)
 
@@ -308,6 +461,19 @@ class Invoice(models.Model):
     address = models.CharField(max_length=255)
     vat = models.FloatField(default=9)
 
+    # Postgres sequence behind invoice numbers (created in migration 0007)
+    NUMBER_SEQUENCE = 'invoice_number_seq'
+
+    @classmethod
+    def next_number(cls):
+        """
+        Allocate the next invoice number from the DB sequence.
+        Safe under concurrent verifications; no scan over existing invoices.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [cls.NUMBER_SEQUENCE])
+            return cursor.fetchone()[0]
+
     def __str__(self):
         return f"{self.user} - {self.number}"
 
@@ -331,5 +497,50 @@ class Payment(models.Model):
     error_code = models.CharField(max_length=50, blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
 
+    def mark_done(self, ref_id):
+        """
+        Record a verified payment: number the invoice and take the sold items out of stock.
+        The payment row is locked, so repeated/concurrent verifications apply this once.
+
+        Returns:
+            bool: False if the payment was already done
+        """
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().get(pk=self.pk)
+            if payment.status == self.STATUS_DONE:
+                return False
+
+            # Update your payment and invoice records
+            payment.ref = ref_id
+            payment.status = self.STATUS_DONE
+            payment.save()
+
+            invoice = payment.invoice
+
+            # Assign unique invoice number
+            if invoice.number is None:
+                invoice.number = Invoice.next_number()
+
+            # Update product counts in one UPDATE, computed in the DB (no read-modify-write)
+            sold = dict(InvoiceItem.objects.filter(invoice=invoice).values_list('product_id', 'count'))
+            if sold:
+                Product.objects.filter(id__in=sold).update(
+                    count=F('count') - Case(*[When(id=product_id, then=Value(count))
+                                              for product_id, count in sold.items()],
+                                            output_field=models.IntegerField())
+                )
+
+            invoice.save()
+
+        self.ref, self.status = payment.ref, payment.status
+        return True
+
+    class Meta:
+        indexes = [
+            # VerifyView looks payments up by authority (+ status);
+            # the leading column also serves authority-only lookups
+            models.Index(fields=['authority', 'status'], name='payment_authority_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.invoice.user.username}: {self.invoice.id}"
\ No newline at end of file
@@ -8,11 +8,30 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProductListListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Serialize each distinct category once and share it across its products
+        products = list(data.all() if hasattr(data, 'all') else data)
+        self.categories = {}
+        for product in products:
+            if product.category_id not in self.categories:
+                self.categories[product.category_id] = CategorySerializer(product.category).data
+        return super().to_representation(products)
+
+
 class ProductListSerializer(serializers.ModelSerializer):
-    category = CategorySerializer()
+    category = serializers.SerializerMethodField()
     class Meta:
         model = models.Product
-        fields = '__all__'
+        # search_vector is an internal index column
+        exclude = ['search_vector']
+        list_serializer_class = ProductListListSerializer
+
+    def get_category(self, obj):
+        categories = getattr(self.parent, 'categories', None)
+        if categories is not None:
+            return categories[obj.category_id]
+        return CategorySerializer(obj.category).data
 
 
 class AddToCartSerializer(serializers.Serializer):
@@ -0,0 +1,18 @@
+from django.contrib.sessions.serializers import JSONSerializer
+
+
+class CartJSONSerializer(JSONSerializer):
+    """
+    JSON session serializer that hands the cart back with int product ids.
+
+    JSON object keys are always strings, so the cart ({product_id: count}) is
+    re-keyed once here when the session is decoded; the cart code then works
+    with ints throughout. Sessions served from the cache skip this entirely.
+    """
+
+    def loads(self, data):
+        session = super().loads(data)
+        cart = session.get('cart')
+        if isinstance(cart, dict):
+            session['cart'] = {int(key): count for key, count in cart.items() if key.isdigit()}
+        return session
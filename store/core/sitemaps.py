@@ -19,11 +19,12 @@ class ProductSitemap(Sitemap):
 
     def items(self):
         # Only include products that are enabled, not deleted, and in stock
+        # Only load the columns lastmod/location use; stable order for pagination
         return Product.objects.filter(
             enabled=True,
             deleted=False,
             count__gt=0
-        )
+        ).only('id', 'modified_date').order_by('id')
 
     def lastmod(self, obj):
         return obj.modified_date
@@ -0,0 +1,93 @@
+import logging
+import requests
+from celery import shared_task
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def process_product_image(product_id):
+    """
+    Resize/re-encode a freshly uploaded product image outside the request cycle.
+    The raw upload is replaced by the processed JPEG and deleted.
+    """
+    from .models import Product
+
+    try:
+        product = Product.objects.get(pk=product_id)
+    except Product.DoesNotExist:
+        return
+
+    if not product.image:
+        return
+
+    raw_name = product.image.name
+    try:
+        processed = product._process_image()
+    except Exception as e:
+        # Keep serving the original upload rather than a placeholder forever
+        logger.error(f"Error processing image for product {product.name}: {e}")
+        processed = False
+
+    if not processed:
+        # Upload kept as is (already web-sized, or processing failed)
+        Product.objects.filter(pk=product_id).update(image_processed=True)
+        return
+
+    product.image_processed = True
+    product.save(update_fields=['image', 'image_processed'], skip_image_processing=True)
+    product._delete_image_file(raw_name)
+    logger.info(f"Image processed for product {product.name}")
+
+
+@shared_task
+def delete_product_image(image_name):
+    """
+    Delete the image file of a product that was deleted.
+    """
+    try:
+        default_storage.delete(image_name)
+        logger.info(f"Cleaned up image for deleted product: {image_name}")
+    except Exception as e:
+        logger.error(f"Error cleaning up image {image_name} for deleted product: {e}")
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), max_retries=5,
+             retry_backoff=2, retry_backoff_max=60, acks_late=True)
+def verify_payment(self, payment_id):
+    """
+    Verify a pending payment with ZarinPal and credit it (see Payment.mark_done).
+    Any error is retried with backoff (mark_done is idempotent, so a retry after a
+    partial run is safe); after the last network retry the payment is marked failed.
+    """
+    from .models import Payment
+    from . import zarinpal
+
+    payment = Payment.objects.filter(pk=payment_id, status=Payment.STATUS_PENDING).first()
+    if payment is None:
+        return
+
+    # Only a still-pending payment is marked failed; never overwrite a verified one
+    pending = Payment.objects.filter(pk=payment_id, status=Payment.STATUS_PENDING)
+
+    try:
+        verify_result = zarinpal.verify(int(payment.total), payment.authority)
+    except requests.exceptions.RequestException as e:
+        if self.request.retries < self.max_retries:
+            raise
+        logger.error(f"Payment {payment_id} verification failed: {e}")
+        pending.update(status=Payment.STATUS_ERROR, error_message='Network error!')
+        return
+
+    # A successful verification has a 'data' object with 'ref_id'
+    # (101 = already verified at ZarinPal, e.g. an earlier attempt got there first)
+    data = verify_result.get('data') or {}
+    if data.get('code') in (100, 101):
+        payment.mark_done(data['ref_id'])
+        logger.info(f"Payment {payment_id} verified, ref {data['ref_id']}")
+    else:
+        errors = verify_result.get('errors') or {}
+        pending.update(status=Payment.STATUS_ERROR,
+                       error_code=str(errors.get('code', 'Unknown')),
+                       error_message='Payment not verified!!')
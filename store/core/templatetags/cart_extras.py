@@ -1,9 +1,22 @@
 # core/templatetags/cart_extras.py
 
+from functools import lru_cache
 from django import template
 
 register = template.Library()
 
+
+def _to_float(value):
+    """Cast to float, skipping the call when it already is one (e.g. after_discount output)."""
+    return value if isinstance(value, float) else float(value)
+
+
+@lru_cache(maxsize=256)
+def _format_percent(value):
+    # A catalog uses only a handful of discount values, so the strings are reused
+    return format(value, '.0f') + '%'
+
+
 @register.filter
 def multiply(value, arg):
     """
@@ -11,7 +24,7 @@ def multiply(value, arg):
     Usage: {{ value|multiply:arg }}
     """
     try:
-        return float(value) * float(arg)
+        return _to_float(value) * _to_float(arg)
     except (ValueError, TypeError):
         return 0
 
@@ -22,7 +35,7 @@ def subtract(value, arg):
     Usage: {{ value|subtract:arg }}
     """
     try:
-        return float(value) - float(arg)
+        return _to_float(value) - _to_float(arg)
     except (ValueError, TypeError):
         return 0
 
@@ -34,18 +47,34 @@ def after_discount(price, discount):
     Usage: {{ product.price|after_discount:product.discount }}
     """
     try:
-        return float(price) * (1 - float(discount)/100)
+        price_f = _to_float(price)
+        return price_f - price_f * _to_float(discount) * 0.01
     except (ValueError, TypeError):
         return price
 
 
+@register.simple_tag
+def line_total(product, count):
+    """
+    Returns the discounted total of a cart line in one call,
+    instead of chaining after_discount and multiply.
+    Usage: {% line_total product quantity as item_total %}
+    """
+    try:
+        price = _to_float(product.price)
+        return (price - price * _to_float(product.discount) * 0.01) * _to_float(count)
+    except (ValueError, TypeError, AttributeError):
+        return 0
+
+
 @register.filter
 def get_item(dictionary, key):
     """
     Usage: {{ cart|get_item:product.id }}
-    Gets the value from dictionary using key (e.g. cart['1'])
+    Gets the value from dictionary using key (e.g. cart[1])
+    ShowCartView passes the cart with int keys, so no str() per lookup.
     """
-    return dictionary.get(str(key))  # Convert key to string (session keys are strings)
+    return dictionary.get(key)
 
 
 @register.filter
@@ -55,7 +84,7 @@ def as_percent(value):
     Usage: {{ discount|as_percent }}
     """
     try:
-        return f"{float(value):.0f}%"
+        return _format_percent(_to_float(value))
     except (ValueError, TypeError):
         return "0%"
 
@@ -64,9 +93,17 @@ def as_percent(value):
 def dict_values_sum(dictionary):
     """
     Returns the sum of all values in a dictionary.
-    For cart: {'1': 2, '3': 1} → 3
+    For cart: {1: 2, 3: 1} → 3
     """
+    try:
+        # Counts are stored as ints by add_to_cart, so sum them in C directly
+        return sum(dictionary.values())
+    except TypeError:
+        pass
+    except AttributeError:
+        return 0  # Not a dict (e.g. no cart in session yet)
+
     try:
         return sum(int(v) for v in dictionary.values())
-    except:
+    except (ValueError, TypeError):
         return 0
\ No newline at end of file
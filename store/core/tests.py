@@ -1,3 +1,179 @@
-from django.test import TestCase
+import requests
+import requests_mock
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.test import SimpleTestCase, TestCase, override_settings
 
-# Create your tests here.
+from . import models, tasks, zarinpal
+from .session_serializers import CartJSONSerializer
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductSearchVectorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='staff', email='staff@example.com', password='x', phone='09120000000')
+        cls.category = models.Category.objects.create(name='Kitchen', user=cls.user)
+
+    def matches(self, product, query):
+        return models.Product.objects.filter(
+            pk=product.pk, search_vector=SearchQuery(query, config='english')).exists()
+
+    def test_create_builds_search_vector(self):
+        product = models.Product.objects.create(
+            name='Espresso grinder', description='Burr grinder', category=self.category, user=self.user)
+        self.assertTrue(self.matches(product, 'grinder'))
+
+    def test_plain_save_keeps_search_vector(self):
+        # create -> modify a non-search field -> save must not write the stale in-memory vector back
+        product = models.Product.objects.create(
+            name='Espresso grinder', description='Burr grinder', category=self.category, user=self.user)
+        product.count = 5
+        product.save()
+
+        self.assertTrue(self.matches(product, 'grinder'))
+        self.assertEqual(models.Product.objects.get(pk=product.pk).count, 5)
+
+    def test_renaming_product_rebuilds_search_vector(self):
+        product = models.Product.objects.create(
+            name='Espresso grinder', description='Burr grinder', category=self.category, user=self.user)
+        product = models.Product.objects.get(pk=product.pk)
+        product.name = 'Kettle'
+        product.description = 'Gooseneck kettle'
+        product.save()
+
+        self.assertTrue(self.matches(product, 'kettle'))
+        self.assertFalse(self.matches(product, 'grinder'))
+
+    def test_category_rename_survives_stale_product_save(self):
+        product = models.Product.objects.create(
+            name='Espresso grinder', description='Burr grinder', category=self.category, user=self.user)
+        stale = models.Product.objects.get(pk=product.pk)
+
+        category = models.Category.objects.get(pk=self.category.pk)
+        category.name = 'Barista'
+        category.save()
+
+        stale.count = 3
+        stale.save()
+
+        self.assertTrue(self.matches(product, 'barista'))
+
+
+class PaymentTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='buyer', email='buyer@example.com', password='x', phone='09120000001')
+        category = models.Category.objects.create(name='Kitchen', user=cls.user)
+        cls.product = models.Product.objects.create(
+            name='Kettle', description='Gooseneck kettle', price=1000, count=5,
+            category=category, user=cls.user)
+        invoice = models.Invoice.objects.create(user=cls.user, total=2000, address='Tehran')
+        models.InvoiceItem.objects.create(
+            invoice=invoice, product=cls.product, name='Kettle',
+            count=2, price=1000, discount=0, total=2000)
+        cls.payment = models.Payment.objects.create(
+            invoice=invoice, total=2180, authority='A0000000000000000000000000000000001', description='')
+
+    def reload(self):
+        self.payment.refresh_from_db()
+        self.payment.invoice.refresh_from_db()
+        self.product.refresh_from_db()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MarkDoneTests(PaymentTestMixin, TestCase):
+    def test_repeated_mark_done_applies_once(self):
+        self.assertTrue(self.payment.mark_done('REF1'))
+        self.reload()
+        number = self.payment.invoice.number
+
+        self.assertFalse(models.Payment.objects.get(pk=self.payment.pk).mark_done('REF2'))
+        self.reload()
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_DONE)
+        self.assertEqual(self.payment.ref, 'REF1')
+        self.assertIsNotNone(number)
+        self.assertEqual(self.payment.invoice.number, number)
+        self.assertEqual(self.product.count, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VerifyPaymentTaskTests(PaymentTestMixin, TestCase):
+    def verify(self, mocker, **response):
+        mocker.post(zarinpal.VERIFY_URL, **response)
+        tasks.verify_payment(self.payment.pk)
+        self.reload()
+
+    def test_code_100_credits_payment(self):
+        with requests_mock.Mocker() as mocker:
+            self.verify(mocker, json={'data': {'code': 100, 'ref_id': 201}, 'errors': []})
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_DONE)
+        self.assertEqual(self.payment.ref, '201')
+        self.assertEqual(self.product.count, 3)
+
+    def test_redelivered_task_credits_payment_once(self):
+        with requests_mock.Mocker() as mocker:
+            self.verify(mocker, json={'data': {'code': 100, 'ref_id': 201}, 'errors': []})
+            # A redelivered task finds the payment done and doesn't call ZarinPal again
+            self.verify(mocker, json={'data': {'code': 101, 'ref_id': 201}, 'errors': []})
+            self.assertEqual(mocker.call_count, 1)
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_DONE)
+        self.assertEqual(self.product.count, 3)
+
+    def test_code_101_on_first_attempt_credits_payment(self):
+        # Already verified at ZarinPal, e.g. by an attempt that died before mark_done
+        with requests_mock.Mocker() as mocker:
+            self.verify(mocker, json={'data': {'code': 101, 'ref_id': 202}, 'errors': []})
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_DONE)
+        self.assertEqual(self.payment.ref, '202')
+        self.assertEqual(self.product.count, 3)
+
+    def test_gateway_error_marks_payment_failed(self):
+        with requests_mock.Mocker() as mocker:
+            self.verify(mocker, json={'data': [], 'errors': {'code': -51, 'message': 'Session is not valid'}})
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_ERROR)
+        self.assertEqual(self.payment.error_code, '-51')
+        self.assertEqual(self.product.count, 5)
+
+    def test_network_error_is_retried(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.post(zarinpal.VERIFY_URL, exc=requests.exceptions.ConnectTimeout)
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                tasks.verify_payment(self.payment.pk)
+        self.reload()
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_PENDING)
+
+    def test_network_error_on_last_retry_marks_payment_failed(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.post(zarinpal.VERIFY_URL, exc=requests.exceptions.ConnectTimeout)
+            tasks.verify_payment.apply(args=[self.payment.pk], retries=tasks.verify_payment.max_retries)
+        self.reload()
+
+        self.assertEqual(self.payment.status, models.Payment.STATUS_ERROR)
+        self.assertEqual(self.payment.error_message, 'Network error!')
+
+
+class CartJSONSerializerTests(SimpleTestCase):
+    def test_cart_round_trips_with_int_keys(self):
+        serializer = CartJSONSerializer()
+        session = serializer.loads(serializer.dumps({'cart': {3: 2, 10: 1}, 'other': {'1': 'x'}}))
+
+        self.assertEqual(session['cart'], {3: 2, 10: 1})
+        # Only the cart is re-keyed
+        self.assertEqual(session['other'], {'1': 'x'})
+
+    def test_non_numeric_cart_keys_are_dropped(self):
+        serializer = CartJSONSerializer()
+        session = serializer.loads(serializer.dumps({'cart': {'7': 1, 'abc': 4}}))
+
+        self.assertEqual(session['cart'], {7: 1})
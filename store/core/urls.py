@@ -23,6 +23,7 @@ urlpatterns = [
     path('cart', views.ShowCartView.as_view(), name='cart_show'),
     path('checkout', views.CheckoutCartView.as_view(), name='checkout'),
     path('verify', views.VerifyView.as_view(), name='verify'),
+    path('payment/status', views.PaymentStatusView.as_view(), name='payment_status'),
     path('api/product', views.ProductListAPIView.as_view(), name='api_product'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -4,31 +4,24 @@ from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
-import requests
-import json
-from django.db.models import Max
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework.views import APIView
-from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import TokenAuthentication
 from rest_framework import status
+from rest_framework.pagination import PageNumberPagination
 from django.contrib.postgres.search import (
-SearchVector,
 SearchQuery,
 SearchRank
 )
 from django.contrib.postgres.search import TrigramSimilarity
-from django.db.models import Q
+from django.db.models import F, Q
 from . import serializers
 from . import forms
 from . import models
-
-# ZarinPal Configuration
-ZARINPAL_MERCHANT_ID = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
-ZARINPAL_REQUEST_URL = 'https://sandbox.zarinpal.com/pg/v4/payment/request.json'
-ZARINPAL_VERIFY_URL = 'https://sandbox.zarinpal.com/pg/v4/payment/verify.json'
-ZARINPAL_START_PAY_URL = 'https://sandbox.zarinpal.com/pg/StartPay/'
-
+from . import tasks
+from . import zarinpal
 
 def get_user_ip(request):
     """Get user's IP address"""
@@ -40,8 +33,23 @@ def get_user_ip(request):
     return ip
 
 
+def get_listing_categories():
+    """
+    Categories for the product list filter, cached until a category changes
+    (see models.invalidate_category_list_cache).
+    """
+    categories = cache.get(models.CATEGORY_LIST_CACHE_KEY)
+    if categories is None:
+        categories = list(
+            models.Category.objects.filter(deleted=False).order_by('name').only('id', 'name')
+        )
+        cache.set(models.CATEGORY_LIST_CACHE_KEY, categories, 60 * 60)
+    return categories
+
+
 def get_cart(request):
-    # initializing the cart
+    # initializing the cart: {product_id (int): count (int)}
+    # (int keys are restored by core.session_serializers.CartJSONSerializer)
     # first time returns {} or may be cart is corrupted from before
     cart = request.session.get('cart', {})
     if not cart or not isinstance(cart, dict):
@@ -51,80 +59,54 @@ def get_cart(request):
 
 def add_to_cart(cart, obj):
     if obj.count > 0 and obj.enabled:
-        cart[str(obj.id)] = cart.get(str(obj.id), 0) + 1
+        cart[obj.id] = cart.get(obj.id, 0) + 1
 
 
 def remove_from_cart(cart, item_id):
-    item_id_str = str(item_id)
-    if item_id_str in cart:
-        del cart[item_id_str]
+    cart.pop(item_id, None)
 
 
 def get_cart_total_price(cart):
-    total = 0
-
+    """Cart total after discounts, in one query and one pass over the cart."""
     if not cart:
-        return total
-
-    # Convert string keys to integers safely
-    try:
-        product_ids = [int(id) for id in cart.keys() if id.isdigit()]
-    except (ValueError, TypeError):
-        return 0  # Return 0 if any ID is invalid
-
-    if not product_ids:
         return 0
 
-    # Fetch all products in one query
-    products = models.Product.objects.filter(id__in=product_ids)
-    product_map = {product.id: product for product in products}  # Now keys are int → int
-
-    for id_str, count in cart.items():
-        try:
-            product_id = int(id_str)
-            product = product_map.get(product_id)
-            if not product:
-                continue  # Skip if product doesn't exist (was deleted, etc.)
-
-            # Handle discount safely
-            discount = product.discount or 0  # Treat None as 0
-
-            price = float(product.price)
-            count = int(count) if str(count).isdigit() else 0
+    # Products that no longer exist are skipped
+    products = models.Product.objects.only('id', 'price', 'discount').in_bulk(list(cart))
+    total = sum(
+        float(product.price) * (1 - (product.discount or 0) / 100) * cart[product_id]
+        for product_id, product in products.items()
+    )
 
-            total += price * (1 - discount / 100) * count
+    return round(total, 2)
 
-        except (ValueError, TypeError, AttributeError):
-            # Skip any item that causes an error
-            continue
 
-    return round(total, 2)  # Optional: round to 2 decimal places
-
-
-def prepare_cart_data(cart):
+def prepare_cart_data(cart, products_map=None):
     """Helper to calculate cart totals"""
-    product_ids = [int(id) for id in cart.keys() if id.isdigit()]
-    products = models.Product.objects.filter(id__in=product_ids)
+    if products_map is None:
+        # One query for all cart products (instead of one .get() per line)
+        products_map = models.Product.objects.in_bulk(list(cart))
 
     cart_items = []
     subtotal = 0
+    items_total = 0  # after discount, summed in the same pass
     for item_id, count in cart.items():
-        try:
-            product = products.get(id=int(item_id))
-            count = int(count)
-            item_total = product.price * count * (1 - product.discount / 100)
-            subtotal += product.price * count  # original price
-            cart_items.append({
-                'product': product,
-                'count': count,
-                'price': float(product.price),
-                'discount': product.discount,
-                'total': float(item_total),
-            })
-        except models.Product.DoesNotExist:
-            continue
+        product = products_map.get(item_id)
+        if product is None:
+            continue  # Skip if product doesn't exist (was deleted, etc.)
+        line_subtotal = product.price * count  # original price
+        item_total = float(line_subtotal * (1 - product.discount / 100))
+        subtotal += line_subtotal
+        items_total += item_total
+        cart_items.append({
+            'product': product,
+            'count': count,
+            'price': float(product.price),
+            'discount': product.discount,
+            'total': item_total,
+        })
 
-    discount_total = subtotal - sum(item['total'] for item in cart_items)
+    discount_total = subtotal - items_total
     vat_rate = 9
     vat_amount = float(subtotal - discount_total) * vat_rate / 100
     total = (subtotal - discount_total) + vat_amount
@@ -132,6 +114,32 @@ def prepare_cart_data(cart):
     return cart_items, float(subtotal), float(discount_total), vat_amount, total
 
 
+def load_cart(request, fields=None):
+    """
+    Read the session cart and fetch all of its products with a single query.
+    fields limits the product columns loaded (as in QuerySet.only()).
+
+    Returns:
+        tuple: (cart, products_map, cart_items, totals) where totals holds
+        subtotal, discount_total, cart_total (after discount, before VAT), vat_amount & total
+    """
+    cart = get_cart(request)
+    products = models.Product.objects
+    if fields:
+        products = products.only(*fields)
+    products_map = products.in_bulk(list(cart))
+
+    cart_items, subtotal, discount_total, vat_amount, total = prepare_cart_data(cart, products_map)
+    totals = {
+        'subtotal': subtotal,
+        'discount_total': discount_total,
+        'cart_total': round(subtotal - discount_total, 2),
+        'vat_amount': vat_amount,
+        'total': total,
+    }
+    return cart, products_map, cart_items, totals
+
+
 class ListProducts(View):
     def get(self, request):
         # Filter products: enabled, not deleted, count > 0
@@ -139,20 +147,20 @@ class ListProducts(View):
             enabled=True,
             deleted=False,
             count__gt=0
+        ).only(
+            # Only the columns the product cards render (they don't show the category)
+            'id', 'name', 'description', 'price', 'discount', 'count',
+            'image', 'image_processed',
         )
 
         # Get category filter from URL (e.g., ?category=3)
         category_id = request.GET.get('category')
-        if category_id:
-            try:
-                products = products.filter(category_id=category_id)
-            except:
-                pass  # Ignore invalid category
+        if category_id and category_id.isdecimal():
+            products = products.filter(category_id=int(category_id))
+        # Anything else (e.g. ?category=abc) is ignored
 
         # Get all categories (only those that have products and are not deleted)
-        categories = models.Category.objects.filter(
-            deleted=False
-        ).order_by('name')
+        categories = get_listing_categories()
 
         context = {
             'products': products,
@@ -209,30 +217,29 @@ class EmptyCartView(View):
 
 class ShowCartView(View):
     def get(self, request):
-        cart = get_cart(request)
-        total = get_cart_total_price(cart)
+        cart, products_map, cart_items, totals = load_cart(request)
 
-        product_ids = [int(id) for id in cart.keys() if id.isdigit()]
-        products = models.Product.objects.filter(id__in=product_ids)
+        # Only lines whose product still exists
+        cart_counts = {item['product'].id: item['count'] for item in cart_items}
+        products = [item['product'] for item in cart_items]
 
         return render(request, 'core/cart.html',
-                      {'cart': cart, 'total': total, 'products': products})
+                      {'cart': cart_counts, 'total': totals['cart_total'], 'products': products})
 
 
 class CheckoutCartView(LoginRequiredMixin, View):
     def get(self, request):
         form = forms.InvoiceForm()
-        cart = get_cart(request)
-        cart_items, subtotal, discount_total, vat_amount, total = prepare_cart_data(cart)
+        cart, products_map, cart_items, totals = load_cart(request)
 
         return render(request, 'core/checkout.html', {
             'form': form,
             'cart_items': cart_items,
-            'subtotal': subtotal,
-            'discount_total': discount_total,
+            'subtotal': totals['subtotal'],
+            'discount_total': totals['discount_total'],
             'vat_rate': 9,  # Adjust as needed
-            'vat_amount': vat_amount,
-            'total': total,
+            'vat_amount': totals['vat_amount'],
+            'total': totals['total'],
         })
 
     def post(self, request):
@@ -240,28 +247,39 @@ class CheckoutCartView(LoginRequiredMixin, View):
         if form.is_valid():
             invoice = form.save(commit=False)
             invoice.user = request.user
-            cart = get_cart(request)
-            invoice.total = get_cart_total_price(cart)
-            invoice.save()
-
-            product_ids = [int(id) for id in cart.keys() if id.isdigit()]
-            items = models.Product.objects.filter(id__in=product_ids)
-
-            invoice_item = []
-            for item_id, item_count in cart.items():
-                obj = items.get(id=int(item_id))
-                invoice_item_obj = models.InvoiceItem()
-                invoice_item_obj.invoice = invoice
-                invoice_item_obj.product = obj
-                invoice_item_obj.name = obj.name
-                invoice_item_obj.count = int(item_count)
-                invoice_item_obj.discount = obj.discount
-                invoice_item_obj.price = obj.price
-                invoice_item_obj.total = (invoice_item_obj.price * invoice_item_obj.count *
-                                          (1 - invoice_item_obj.discount / 100))
-                invoice_item.append(invoice_item_obj)
-
-            models.InvoiceItem.objects.bulk_create(invoice_item)  # save to db
+
+            # Invoice and its items are written in one transaction; the ZarinPal
+            # request below runs after commit. The stock check is only a pre-check:
+            # stock is taken in Payment.mark_done once the payment is verified.
+            with transaction.atomic():
+                # Products are fetched once and reused for the total and the invoice items
+                cart, products_map, cart_items, totals = load_cart(
+                    request, fields=('id', 'name', 'price', 'discount', 'count')
+                )
+
+                for item in cart_items:
+                    if item['count'] > item['product'].count:
+                        error_message = f"Not enough stock for {item['product'].name}."
+                        return render(request, 'core/checkout_error.html', {'msg': error_message})
+
+                invoice.total = totals['cart_total']
+                invoice.save()
+
+                invoice_item = []
+                for item in cart_items:
+                    obj = item['product']
+                    invoice_item_obj = models.InvoiceItem()
+                    invoice_item_obj.invoice = invoice
+                    invoice_item_obj.product = obj
+                    invoice_item_obj.name = obj.name
+                    invoice_item_obj.count = item['count']
+                    invoice_item_obj.discount = obj.discount
+                    invoice_item_obj.price = obj.price
+                    invoice_item_obj.total = item['total']
+                    invoice_item.append(invoice_item_obj)
+
+                # save to db; batched so a huge cart isn't sent as one giant INSERT
+                models.InvoiceItem.objects.bulk_create(invoice_item, batch_size=500)
 
             payment = models.Payment()
             payment.invoice = invoice
@@ -272,32 +290,15 @@ class CheckoutCartView(LoginRequiredMixin, View):
             # Prepare callback URL
             callback_url = request.build_absolute_uri(reverse('core:verify'))
 
-            # Prepare request data for ZarinPal
-            request_data = {
-                'merchant_id': ZARINPAL_MERCHANT_ID,
-                'amount': int(payment.total),
-                'currency': 'IRT',
-                'description': f'invoice, No. {invoice.id}',
-                'callback_url': callback_url,
-                'metadata': {
-                    'email': request.user.email,
-                }
-            }
-
             # Make request to ZarinPal
             try:
-                response = requests.post(
-                    ZARINPAL_REQUEST_URL,
-                    data=json.dumps(request_data),
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Accept': 'application/json'
-                    },
-                    timeout=30
+                response_data = zarinpal.request_payment(
+                    amount=int(payment.total),
+                    description=f'invoice, No. {invoice.id}',
+                    callback_url=callback_url,
+                    email=request.user.email,
                 )
 
-                response_data = response.json()
-
                 if response_data.get('data', {}).get('code') == 100:
                     # Success - redirect to ZarinPal
                     authority = response_data['data']['authority']
@@ -307,7 +308,7 @@ class CheckoutCartView(LoginRequiredMixin, View):
                     payment.save()
 
                     # Redirect to ZarinPal payment page
-                    payment_url = f"{ZARINPAL_START_PAY_URL}{authority}"
+                    payment_url = f"{zarinpal.START_PAY_URL}{authority}"
                     return redirect(payment_url)
 
                 else:
@@ -336,7 +337,8 @@ class CheckoutCartView(LoginRequiredMixin, View):
 
 class VerifyView(View):
     """
-    Verify payment with ZarinPal
+    ZarinPal callback. Verification runs on a Celery worker (tasks.verify_payment);
+    until it finishes the user sees a page that polls PaymentStatusView.
     """
 
     def get(self, request):
@@ -351,86 +353,59 @@ class VerifyView(View):
             })
 
         # Find the corresponding payment in your database
-        try:
-            payment = models.Payment.objects.get(authority=authority, status=models.Payment.STATUS_PENDING)
-        except models.Payment.DoesNotExist:
+        payment = models.Payment.objects.filter(authority=authority).first()
+        if payment is None:
             return render(request, 'core/payment_failed.html', {
                 'reason': 'There is no payment document!'
             })
 
-        # Check if the user canceled the payment
-        if status != 'OK':
-            payment.status = payment.STATUS_ERROR
-            payment.save()
-            return render(request, 'core/payment_failed.html', {
-                'reason': 'Payment was canceled by the user.'
-            })
-
-        # Verify the payment with ZarinPal's server
-        verify_data = {
-            "merchant_id": ZARINPAL_MERCHANT_ID,
-            "amount": int(payment.total),  # Must match the amount in the request
-            "authority": authority
-        }
-        headers = {'Content-Type': 'application/json'}
-
-        try:
-            verify_response = requests.post(
-                ZARINPAL_VERIFY_URL,
-                data=json.dumps(verify_data),
-                headers=headers
-            )
-            verify_result = verify_response.json()
-        except requests.exceptions.RequestException as e:
-            # Handle network errors during verification
-            return render(request, 'core/payment_failed.html', {
-                'reason': 'Network error!'
-            })
-
-        # Check the verification result
-        # A successful verification has a 'data' object with 'ref_id'
-        if verify_result.get('data').get('code') == 100:
-            ref_id = verify_result['data']['ref_id']
-
-            # Update your payment and invoice records
-            payment.ref = ref_id
-            payment.status = payment.STATUS_DONE
-            payment.save()
-
-            # Get the invoice
-            invoice = payment.invoice
-
-            # Assign unique, continuous invoice number
-            if invoice.number is None:
-                max_number = models.Invoice.objects.aggregate(Max('number'))['number__max']
-                invoice.number = (max_number or 0) + 1
-
-            # Update product counts
-            invoice_items = models.InvoiceItem.objects.filter(invoice=invoice)
-            for item in invoice_items:
-                product = item.product
-                product.count -= item.count
-                product.save()
-
-            invoice.save()
-
+        if payment.status == payment.STATUS_DONE:
             # empty cart
             request.session['cart'] = {}
-            request.session.Modified = True
+            request.session.modified = True
 
             return render(request, 'core/payment_success.html', {
-                'ref_id': ref_id,
+                'ref_id': payment.ref,
                 'amount': int(payment.total)
             })
 
-        else:
-            # we can log the error (we had to check code 101)
+        if payment.status == payment.STATUS_ERROR:
+            return render(request, 'core/payment_failed.html', {
+                'reason': payment.error_message or 'Payment not verified!!'
+            })
+
+        # Check if the user canceled the payment
+        if status != 'OK':
             payment.status = payment.STATUS_ERROR
-            payment.save()
+            payment.error_message = 'Payment was canceled by the user.'
+            payment.save(update_fields=['status', 'error_message'])
             return render(request, 'core/payment_failed.html', {
-                'reason': 'Payment not verified!!'
+                'reason': payment.error_message
             })
 
+        # Verify with ZarinPal in the background; enqueue at most once a minute, so the
+        # verifying page's capped-poll reload re-enqueues a verification that got stuck
+        if cache.add(f'core:verify_payment:{payment.pk}', True, 60):
+            tasks.verify_payment.delay(payment.pk)
+
+        return render(request, 'core/payment_verifying.html', {
+            'status_url': f"{reverse('core:payment_status')}?Authority={authority}",
+        })
+
+
+class PaymentStatusView(View):
+    """
+    Polled by the payment_verifying page while tasks.verify_payment runs.
+    """
+
+    def get(self, request):
+        status = models.Payment.objects.filter(
+            authority=request.GET.get('Authority', '')
+        ).values_list('status', flat=True).first()
+        if status is None:
+            return JsonResponse({'status': None}, status=404)
+        return JsonResponse({'status': status})
+
 
 class SearchView(View):
     def get(self, request):
@@ -442,21 +417,19 @@ class SearchView(View):
             form = forms.SearchForm(request.GET)
             if form.is_valid():
                 query = form.cleaned_data['query']
-                search_vector = SearchVector('name', 'description', 'category__name', config='english')
                 search_query = SearchQuery(query, config='english')
 
+                # Both conditions are served by GIN indexes: @@ on the persisted
+                # search_vector and % (trigram_similar) on name (gin_trgm_ops), so
+                # rank/similarity are only computed for matching rows
                 results = (
-                    models.Product.objects.annotate(
-                        search=search_vector,
-                        rank=SearchRank(search_vector, search_query),
-                        similarity=(
-                                TrigramSimilarity('name', query) * 1.5 +
-                                TrigramSimilarity('description', query) +
-                                TrigramSimilarity('category__name', query) * 0.8
-                        )
-                    )
+                    models.Product.objects.defer('search_vector')
                     .filter(
-                        Q(search=search_query) | Q(similarity__gt=0.1)
+                        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+                    )
+                    .annotate(
+                        rank=SearchRank(F('search_vector'), search_query),
+                        similarity=TrigramSimilarity('name', query),
                     )
                     .order_by('-rank', '-similarity')
                 )
@@ -471,14 +444,27 @@ class SearchView(View):
             }
         )
 
+class ProductPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class ProductListAPIView(APIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [TokenAuthentication]
 
     def get(self, request, format=None):
-        obj = models.Product.objects.all()
-        s = serializers.ProductListSerializer(obj, many=True)
-        return Response(s.data)
+        # category is serialized for every product, fetch it with one JOIN
+        obj = (
+            models.Product.objects.select_related('category')
+            .defer('search_vector')
+            .order_by('id')
+        )
+        paginator = ProductPagination()
+        page = paginator.paginate_queryset(obj, request, view=self)
+        s = serializers.ProductListSerializer(page, many=True)
+        return paginator.get_paginated_response(s.data)
 
 
 # ADD TO CART WITH API
@@ -0,0 +1,62 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ZarinPal Configuration
+MERCHANT_ID = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+REQUEST_URL = 'https://sandbox.zarinpal.com/pg/v4/payment/request.json'
+VERIFY_URL = 'https://sandbox.zarinpal.com/pg/v4/payment/verify.json'
+START_PAY_URL = 'https://sandbox.zarinpal.com/pg/StartPay/'
+
+# Shared session: keeps the TLS connection to ZarinPal alive between requests
+# (per web process and per Celery worker).
+# urllib3 only retries POSTs that never reached the server (connect errors).
+session = requests.Session()
+session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+session.headers.update({'Accept': 'application/json'})
+
+# Payment request fields that are the same for every checkout
+_REQUEST_TEMPLATE = {
+    'merchant_id': MERCHANT_ID,
+    'currency': 'IRT',
+}
+
+
+def request_payment(amount, description, callback_url, email):
+    """
+    Open a payment at ZarinPal.
+
+    Returns:
+        dict: the decoded response; data.code 100 means data.authority is set.
+        Raises requests.exceptions.RequestException on network errors.
+    """
+    request_data = {
+        **_REQUEST_TEMPLATE,
+        'amount': amount,
+        'description': description,
+        'callback_url': callback_url,
+        'metadata': {'email': email},
+    }
+    response = session.post(REQUEST_URL, json=request_data, timeout=30)
+    return response.json()
+
+
+def verify(amount, authority):
+    """
+    Ask ZarinPal to verify a payment.
+
+    Returns:
+        dict: the decoded response; data.code 100 (or 101, already verified) means paid.
+        Raises requests.exceptions.RequestException on network errors.
+    """
+    verify_data = {
+        "merchant_id": MERCHANT_ID,
+        "amount": amount,  # Must match the amount in the request
+        "authority": authority
+    }
+    response = session.post(VERIFY_URL, json=verify_data, timeout=30)
+    return response.json()
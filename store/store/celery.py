@@ -0,0 +1,20 @@
+"""
+Celery config for store project.
+
+Workers are started with:
+    celery -A store worker -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'store.settings')
+
+app = Celery('store')
+
+# Read every CELERY_* setting from Django settings
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Load tasks.py from all installed apps
+app.autodiscover_tasks()
@@ -169,6 +169,19 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')  # 16-digit App Password (no
 # Site (required for get_current_site)
 SITE_ID = 1  # Requires django.contrib.sites
 
+# Cache (Redis). Also backs sessions, category list, etc.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://localhost:6379/1'),
+    }
+}
+
+# Sessions are read from the cache and written through to the DB,
+# so cart requests don't hit the session table on every read
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# JSON, but the cart comes back keyed by int product id
+SESSION_SERIALIZER = 'core.session_serializers.CartJSONSerializer'
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 # SESSION_COOKIE_AGE = 20 * 60 # IN SECONDS
 
@@ -185,4 +198,9 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
-}
\ No newline at end of file
+}
+
+# Celery (background tasks)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE